@@ -3,37 +3,58 @@
 Analyze Elo calibration results and compute estimated Elo ratings for each depth.
 """
 
+import bisect
+import math
 import re
 import sys
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List, Tuple
 
+import numpy as np
+
+# Filename format: d{depth}_sf{elo}.log
+NAME_RE = re.compile(r'd(\d+)_sf(\d+)\.log')
+
+# fastchess summary line, e.g.:
+#   Games: 2, Wins: 0, Losses: 2, Draws: 0, Points: 0.0 (0.00 %)
+RESULTS_RE = re.compile(r'Wins:\s*(\d+).*?Losses:\s*(\d+).*?Draws:\s*(\d+).*?Points:\s*([\d.]+)')
+
+# Elo difference lookup table indexed by score in 0.1% steps (idx = score% * 10).
+# 0.1% granularity is far finer than the sampling noise of a calibration match,
+# so tabulating -400*log10(1/s - 1) once at import replaces a libm call per
+# evaluation. Endpoints are clamped to [1%, 99%] like the scalar formula was.
+ELO_DIFF_TABLE = np.array([
+    -400 * math.log10(1 / (min(990, max(10, s)) / 1000) - 1)
+    for s in range(1001)
+])
+
 def parse_log_file(log_path: Path) -> Tuple[str, str, float, int, int, int]:
     """Parse a calibration log file and extract results."""
-    content = log_path.read_text()
-
     # Extract depth and Stockfish Elo from filename
-    # Format: d{depth}_sf{elo}.log
-    match = re.match(r'd(\d+)_sf(\d+)\.log', log_path.name)
+    match = NAME_RE.match(log_path.name)
     if not match:
         return None
 
     depth = match.group(1)
     sf_elo = match.group(2)
 
-    # Extract game results
-    wins_match = re.search(r'Wins: (\d+)', content)
-    losses_match = re.search(r'Losses: (\d+)', content)
-    draws_match = re.search(r'Draws: (\d+)', content)
-    points_match = re.search(r'Points: ([\d.]+)', content)
+    # Extract game results in a single pass over the file; iterating lines
+    # avoids loading large logs and re-scanning the content per field.
+    results_match = None
+    with log_path.open() as f:
+        for line in f:
+            results_match = RESULTS_RE.search(line)
+            if results_match:
+                break
 
-    if not all([wins_match, losses_match, draws_match, points_match]):
+    if not results_match:
         return None
 
-    wins = int(wins_match.group(1))
-    losses = int(losses_match.group(1))
-    draws = int(draws_match.group(1))
-    points = float(points_match.group(1))
+    wins = int(results_match.group(1))
+    losses = int(results_match.group(2))
+    draws = int(results_match.group(3))
+    points = float(results_match.group(4))
     games = wins + losses + draws
 
     score_percentage = (points / games) * 100 if games > 0 else 0
@@ -46,15 +67,8 @@ def estimate_elo_from_score(opponent_elo: int, score_percentage: float) -> int:
     Uses the standard Elo formula: Expected Score = 1 / (1 + 10^((opponent - player) / 400))
     Solving for player rating: player = opponent - 400 * log10(1/score - 1)
     """
-    import math
-
-    # Clamp score to avoid division by zero or log of negative
-    score = max(0.01, min(0.99, score_percentage / 100))
-
-    # Elo difference formula
-    elo_diff = -400 * math.log10((1 / score) - 1)
-
-    return int(opponent_elo + elo_diff)
+    idx = min(1000, max(0, int(round(score_percentage * 10))))
+    return int(opponent_elo + ELO_DIFF_TABLE[idx])
 
 def main():
     results_dir = Path("./elo_calibration_results")
@@ -86,19 +100,27 @@ def main():
         print(f"DEPTH {depth}")
         print("-" * 80)
 
-        elo_estimates = []
+        # Sort by Stockfish Elo only; a plain tuple sort would rich-compare
+        # the whole row on ties
+        rows = sorted(results[depth], key=itemgetter(0))
+
+        # Vectorized Elo estimation over all opponents at this depth,
+        # via the precomputed 0.1%-granularity difference table.
+        opp = np.array([row[0] for row in rows], dtype=np.float64)
+        idx = np.clip(
+            (np.array([row[1] for row in rows]) * 10).round().astype(int), 0, 1000
+        )
+        elo_estimates = (opp + ELO_DIFF_TABLE[idx]).astype(int).tolist()
+
         total_games = 0
         total_points = 0
 
-        for sf_elo, score_pct, wins, losses, draws in sorted(results[depth]):
+        for (sf_elo, score_pct, wins, losses, draws), estimated_elo in zip(rows, elo_estimates):
             games = wins + losses + draws
             points = wins + draws * 0.5
             total_games += games
             total_points += points
 
-            estimated_elo = estimate_elo_from_score(sf_elo, score_pct)
-            elo_estimates.append(estimated_elo)
-
             result_str = f"W{wins}-L{losses}-D{draws}"
             print(f"  vs SF {sf_elo:4d}: {score_pct:5.1f}% {result_str:12s} → Est. Elo: {estimated_elo:4d}")
 
@@ -120,25 +142,18 @@ def main():
     print(" Depth | Est. Elo | Skill Level")
     print("-------|----------|----------------------------------")
 
-    skill_levels = {
-        (0, 800): "Beginner",
-        (800, 1000): "Novice",
-        (1000, 1200): "Casual Player",
-        (1200, 1400): "Intermediate",
-        (1400, 1600): "Club Player",
-        (1600, 1800): "Advanced",
-        (1800, 2000): "Expert",
-        (2000, 2200): "Master",
-        (2200, float('inf')): "Strong Master",
-    }
+    # Skill bands as sorted lower-bound thresholds; bisect finds the band
+    # in O(log n) instead of scanning range pairs.
+    skill_thresholds = [0, 800, 1000, 1200, 1400, 1600, 1800, 2000, 2200]
+    skill_names = [
+        "Beginner", "Novice", "Casual Player", "Intermediate", "Club Player",
+        "Advanced", "Expert", "Master", "Strong Master",
+    ]
 
     for depth in sorted(depth_elos.keys()):
         elo = depth_elos[depth]
-        skill = "Unknown"
-        for (low, high), level in skill_levels.items():
-            if low <= elo < high:
-                skill = level
-                break
+        band = bisect.bisect_right(skill_thresholds, elo) - 1
+        skill = skill_names[band] if band >= 0 else "Unknown"
         print(f"   {depth:2d}  |  {elo:4d}    | {skill}")
 
     print()
@@ -150,7 +165,7 @@ def main():
     print("```typescript")
     print("export function eloToDepth(elo: number): number {")
 
-    depths_sorted = sorted(depth_elos.items())
+    depths_sorted = sorted(depth_elos.items(), key=itemgetter(0))
     for i, (depth, depth_elo) in enumerate(depths_sorted):
         if i == 0:
             print(f"  if (elo < {depth_elo}) return {depth};")
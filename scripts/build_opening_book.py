@@ -8,12 +8,192 @@ Outputs positions in a format that can be integrated into opening_book.rs.
 
 import chess
 import chess.pgn
+import chess.polyglot
+import io
+import itertools
+import multiprocessing
+import re
 import sys
-from collections import defaultdict
+from collections import Counter
 from pathlib import Path
 
+ELO_TAG_RE = re.compile(r'^\[(?:White|Black)Elo "(\d+)"\]', re.M)
 
-def extract_openings(pgn_path, max_games=None, min_rating=2200, max_moves=12):
+
+def passes_rating_filter(header_block, min_rating):
+    """Check the average player rating from a raw PGN header block."""
+    elos = ELO_TAG_RE.findall(header_block)
+    if len(elos) != 2:
+        return False
+
+    return (int(elos[0]) + int(elos[1])) / 2 >= min_rating
+
+
+def read_rated_game(pgn_file, min_rating):
+    """
+    Read the next game whose average rating passes the filter.
+
+    Scans raw header lines and regex-checks the ELO tags before any PGN
+    parsing; the movetext of rejected games is consumed line-by-line
+    without ever being tokenized. Accepted games are parsed from the
+    buffered text with chess.pgn.read_game.
+
+    Returns (game, games_scanned); game is None at EOF.
+    """
+    games_scanned = 0
+
+    while True:
+        # Skip blank lines between games
+        line = pgn_file.readline()
+        while line and not line.strip():
+            line = pgn_file.readline()
+        if not line:
+            return None, games_scanned
+
+        # Header block runs until the first blank line
+        header_lines = []
+        while line and line.strip():
+            header_lines.append(line)
+            line = pgn_file.readline()
+
+        games_scanned += 1
+        header_block = ''.join(header_lines)
+        accept = passes_rating_filter(header_block, min_rating)
+
+        # Movetext runs until the next blank line; only buffer it for
+        # games that passed the header filter
+        movetext_lines = []
+        line = pgn_file.readline()
+        while line and line.strip():
+            if accept:
+                movetext_lines.append(line)
+            line = pgn_file.readline()
+
+        if accept:
+            game_text = header_block + '\n' + ''.join(movetext_lines)
+            game = chess.pgn.read_game(io.StringIO(game_text))
+            if game is not None:
+                return game, games_scanned
+
+
+def collect_game_moves(game, book, epds, max_moves):
+    """
+    Add the opening moves of one game to the book.
+
+    The book is a flat Counter keyed by (Zobrist hash, move): one hash
+    probe per increment instead of two for a nested dict-of-dicts, and
+    the int position key hashes in O(1) where a position string hashes
+    in O(len). epds records each key's EPD the first time the position
+    is seen, so output can still print it.
+    """
+    board = game.board()
+    move_count = 0
+
+    # Pre-bind the hot methods once per game
+    push = board.push
+    zobrist = chess.polyglot.zobrist_hash
+
+    for move in game.mainline_moves():
+        if move_count >= max_moves:
+            break
+
+        key = zobrist(board)
+        if key not in epds:
+            epds[key] = board.epd()
+        # Pack the move into a small int (from:6 | to:6 | promotion:4)
+        # instead of allocating a UCI string per ply; decode_move_key
+        # recovers the UCI at output time.
+        book[key, move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)] += 1
+
+        push(move)
+        move_count += 1
+
+
+def decode_move_key(mkey):
+    """Decode a packed move int (from:6 | to:6 | promotion:4) back to UCI."""
+    return chess.Move(
+        mkey & 63, (mkey >> 6) & 63, promotion=(mkey >> 12) or None
+    ).uci()
+
+
+def find_game_chunks(pgn_path, chunk_games=1000):
+    """
+    Split a PGN file into byte ranges of whole games.
+
+    Scans for game boundaries (a line starting with '[Event ' following a
+    blank line) and groups them into chunks of chunk_games games. Returns
+    a list of (start, end) byte offsets covering the whole file.
+    """
+    starts = []
+    with open(pgn_path, 'rb') as f:
+        at_blank = True
+        pos = 0
+        for line in f:
+            if at_blank and line.startswith(b'[Event '):
+                starts.append(pos)
+            at_blank = not line.strip()
+            pos += len(line)
+        file_size = pos
+
+    chunks = []
+    for i in range(0, len(starts), chunk_games):
+        end = starts[i + chunk_games] if i + chunk_games < len(starts) else file_size
+        chunks.append((starts[i], end))
+    return chunks
+
+
+def _extract_chunk(chunk_args):
+    """Worker: extract openings from one byte range of the PGN file."""
+    pgn_path, start, end, min_rating, max_moves = chunk_args
+
+    with open(pgn_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    pgn_file = io.StringIO(data.decode('ascii', errors='replace'))
+    book = Counter()
+    epds = {}
+    games_processed = 0
+    games_used = 0
+
+    while True:
+        game, games_scanned = read_rated_game(pgn_file, min_rating)
+        games_processed += games_scanned
+        if game is None:
+            break
+
+        games_used += 1
+        collect_game_moves(game, book, epds, max_moves)
+
+    return book, epds, games_processed, games_used
+
+
+def _extract_parallel(pgn_path, max_games, min_rating, max_moves, workers, chunk_games=1000):
+    """Shard the PGN across worker processes and merge per-shard books."""
+    book = Counter()
+    epds = {}
+    games_processed = 0
+    games_used = 0
+
+    chunks = find_game_chunks(pgn_path, chunk_games)
+    if max_games:
+        chunks = chunks[:max(1, -(-max_games // chunk_games))]
+
+    tasks = [(pgn_path, start, end, min_rating, max_moves) for start, end in chunks]
+
+    with multiprocessing.Pool(workers) as pool:
+        for part, part_epds, processed, used in pool.imap_unordered(_extract_chunk, tasks):
+            games_processed += processed
+            games_used += used
+            book.update(part)  # Counter.update adds counts
+            for key, epd in part_epds.items():
+                epds.setdefault(key, epd)
+            print(f"Processed {games_processed} games, used {games_used}...", end='\r')
+
+    return book, epds, games_processed, games_used
+
+
+def extract_openings(pgn_path, max_games=None, min_rating=2200, max_moves=12, workers=1):
     """
     Extract opening positions from PGN file.
 
@@ -22,63 +202,56 @@ def extract_openings(pgn_path, max_games=None, min_rating=2200, max_moves=12):
         max_games: Maximum number of games to process (None = all)
         min_rating: Minimum player rating
         max_moves: Maximum number of moves to extract from each game
+        workers: Number of worker processes (games are independent, so
+            the file is sharded into whole-game byte ranges and the
+            per-shard books are merged at the end)
 
     Returns:
-        Dictionary mapping (FEN, move) -> count
+        Dictionary mapping (EPD, move) -> count
     """
-    book = defaultdict(lambda: defaultdict(int))
-    games_processed = 0
-    games_used = 0
-
     print(f"Processing {pgn_path}...")
     print(f"Filters: rating >= {min_rating}, max_moves = {max_moves}")
 
-    with open(pgn_path) as pgn_file:
+    if workers > 1:
+        book, epds, games_processed, games_used = _extract_parallel(
+            pgn_path, max_games, min_rating, max_moves, workers
+        )
+        print(f"\nProcessed {games_processed} games, used {games_used}")
+        print(f"Unique positions: {len(epds)}")
+        return {(epds[key], decode_move_key(mkey)): count for (key, mkey), count in book.items()}
+
+    book = Counter()
+    epds = {}
+    games_processed = 0
+    games_used = 0
+
+    # 1 MiB buffer cuts read() syscalls by ~128x over the 8 KiB default,
+    # and the ASCII decoder is considerably faster than UTF-8 on pure PGN
+    # (non-ASCII only ever shows up in player names, which we don't key on).
+    with open(pgn_path, 'r', buffering=1 << 20, encoding='ascii', errors='replace') as pgn_file:
         while True:
-            game = chess.pgn.read_game(pgn_file)
+            # read_rated_game regex-checks the raw header block and skips
+            # rejected movetext without tokenizing it, so the vast majority
+            # of games on a full Lichess dump never reach the PGN parser.
+            game, games_scanned = read_rated_game(pgn_file, min_rating)
+            games_processed += games_scanned
             if game is None:
                 break
 
-            games_processed += 1
-            if games_processed % 1000 == 0:
-                print(f"Processed {games_processed} games, used {games_used}...", end='\r')
-
             if max_games and games_processed > max_games:
                 break
 
-            # Filter by rating
-            try:
-                white_elo = int(game.headers.get("WhiteElo", 0))
-                black_elo = int(game.headers.get("BlackElo", 0))
-                avg_elo = (white_elo + black_elo) / 2
-
-                if avg_elo < min_rating:
-                    continue
-            except (ValueError, TypeError):
-                continue
-
             games_used += 1
+            collect_game_moves(game, book, epds, max_moves)
 
-            # Extract opening moves
-            board = game.board()
-            move_count = 0
-
-            for move in game.mainline_moves():
-                if move_count >= max_moves:
-                    break
-
-                # Store position and move
-                fen = board.fen()
-                move_uci = move.uci()
-                book[fen][move_uci] += 1
-
-                board.push(move)
-                move_count += 1
+            if games_used % 100 == 0:
+                print(f"Processed {games_processed} games, used {games_used}...", end='\r')
 
     print(f"\nProcessed {games_processed} games, used {games_used}")
-    print(f"Unique positions: {len(book)}")
+    print(f"Unique positions: {len(epds)}")
 
-    return book
+    # Resolve the int keys back to EPD/UCI strings once, for filter_book
+    return {(epds[key], decode_move_key(mkey)): count for (key, mkey), count in book.items()}
 
 
 def filter_book(book, min_frequency=0.05, min_games=10):
@@ -86,16 +259,21 @@ def filter_book(book, min_frequency=0.05, min_games=10):
     Filter book to keep only popular moves.
 
     Args:
-        book: Dictionary of (FEN -> move -> count)
+        book: Flat mapping of (EPD, move) -> count
         min_frequency: Minimum frequency (e.g., 0.05 = 5% of games)
         min_games: Minimum number of games a position must appear in
 
     Returns:
-        Filtered book
+        Filtered book as EPD -> {move: count}
     """
     filtered = {}
 
-    for fen, moves in book.items():
+    # Sorting brings each position's moves together so one groupby pass
+    # rebuilds the per-position move tables.
+    items = sorted(book.items())
+
+    for fen, group in itertools.groupby(items, key=lambda item: item[0][0]):
+        moves = {move: count for (_, move), count in group}
         total_games = sum(moves.values())
 
         if total_games < min_games:
@@ -120,23 +298,28 @@ def generate_rust_code(book, output_path):
     Generate Rust code for opening_book.rs.
 
     Args:
-        book: Dictionary of (FEN -> moves -> count)
+        book: Dictionary of (EPD -> moves -> count)
         output_path: Where to write the Rust code
     """
-    with open(output_path, 'w') as f:
+    # Precompute the game totals once; summing inside the sort key and again
+    # per position walks every move list twice.
+    items = [(fen, moves, sum(moves.values())) for fen, moves in book.items()]
+    items.sort(key=lambda t: t[2], reverse=True)
+
+    with open(output_path, 'w', buffering=1 << 20) as f:
         f.write("// Auto-generated opening book from PGN analysis\n")
         f.write("// Add these positions to populate_basic_openings() in opening_book.rs\n\n")
 
-        for fen, moves in sorted(book.items(), key=lambda x: sum(x[1].values()), reverse=True):
-            total = sum(moves.values())
-
+        for fen, moves, total in items:
             # Sort moves by frequency
             sorted_moves = sorted(moves.items(), key=lambda x: x[1], reverse=True)
 
             # Format as Rust code
             f.write(f"// Position seen in {total} games\n")
             f.write(f'self.add_position(\n')
-            f.write(f'    "{fen}",\n')
+            # Keys are EPDs; pad with dummy move counters since parse_fen
+            # on the Rust side expects all 6 FEN fields.
+            f.write(f'    "{fen} 0 1",\n')
             f.write(f'    vec![')
 
             move_strs = [f'"{move}"' for move, _ in sorted_moves[:5]]  # Top 5 moves
@@ -147,12 +330,16 @@ def generate_rust_code(book, output_path):
 
 def generate_statistics(book, output_path):
     """Generate statistics about the opening book."""
-    with open(output_path, 'w') as f:
+    # One pass over the book for the per-position totals, reused for both
+    # the aggregate stats and the top-20 ranking.
+    items = [(fen, moves, sum(moves.values())) for fen, moves in book.items()]
+
+    with open(output_path, 'w', buffering=1 << 20) as f:
         f.write("# Opening Book Statistics\n\n")
 
         total_positions = len(book)
         total_moves = sum(len(moves) for moves in book.values())
-        total_games = sum(sum(moves.values()) for moves in book.values())
+        total_games = sum(total for _, _, total in items)
 
         f.write(f"Total positions: {total_positions}\n")
         f.write(f"Total move options: {total_moves}\n")
@@ -161,14 +348,9 @@ def generate_statistics(book, output_path):
 
         # Top 20 most common positions
         f.write("## Top 20 Most Common Positions\n\n")
-        sorted_positions = sorted(
-            book.items(),
-            key=lambda x: sum(x[1].values()),
-            reverse=True
-        )[:20]
-
-        for i, (fen, moves) in enumerate(sorted_positions, 1):
-            total = sum(moves.values())
+        items.sort(key=lambda t: t[2], reverse=True)
+
+        for i, (fen, moves, total) in enumerate(items[:20], 1):
             f.write(f"{i}. Games: {total}\n")
             f.write(f"   FEN: {fen}\n")
             f.write(f"   Moves: {', '.join(f'{m} ({c})' for m, c in sorted(moves.items(), key=lambda x: x[1], reverse=True)[:3])}\n\n")
@@ -176,16 +358,18 @@ def generate_statistics(book, output_path):
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python build_opening_book.py <pgn_file> [max_games]")
+        print("Usage: python build_opening_book.py <pgn_file> [max_games] [workers]")
         print("\nExample:")
         print("  python build_opening_book.py lichess_elite.pgn 10000")
+        print("  python build_opening_book.py lichess_elite.pgn 10000 8")
         sys.exit(1)
 
     pgn_path = sys.argv[1]
     max_games = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
 
     # Extract openings
-    book = extract_openings(pgn_path, max_games=max_games)
+    book = extract_openings(pgn_path, max_games=max_games, workers=workers)
 
     # Filter to keep only popular moves
     filtered_book = filter_book(book, min_frequency=0.05, min_games=20)
@@ -26,29 +26,143 @@ import sys
 import chess
 import chess.pgn
 import argparse
+import array
+import gzip
+import io
+import multiprocessing
+import queue
+import re
+import threading
 from typing import Optional, Tuple, List
 
+ELO_TAG_RE = re.compile(r'^\[(?:White|Black)Elo "(\d+)"\]', re.M)
+RESULT_TAG_RE = re.compile(r'^\[Result "(?:1-0|0-1)"\]', re.M)
 
-def is_quiet_position(board: chess.Board) -> bool:
-    """Check if position is quiet (no checks, no hanging pieces)."""
-    # Must not be in check
-    if board.is_check():
-        return False
+# Flush the output buffer once this many lines accumulate
+OUTPUT_FLUSH_LINES = 4096
 
-    # Must have reasonable material (not just pawns)
-    piece_count = len(board.pieces(chess.KNIGHT, chess.WHITE)) + \
-                  len(board.pieces(chess.KNIGHT, chess.BLACK)) + \
-                  len(board.pieces(chess.BISHOP, chess.WHITE)) + \
-                  len(board.pieces(chess.BISHOP, chess.BLACK)) + \
-                  len(board.pieces(chess.ROOK, chess.WHITE)) + \
-                  len(board.pieces(chess.ROOK, chess.BLACK)) + \
-                  len(board.pieces(chess.QUEEN, chess.WHITE)) + \
-                  len(board.pieces(chess.QUEEN, chess.BLACK))
-
-    if piece_count < 4:  # Too few pieces (endgame)
-        return False
+# Output line suffixes indexed by int(score * 2); scores are only ever
+# 0/0.5/1, so a tuple lookup replaces float f-string formatting per line
+# (which also JITs better under pypy3).
+SCORE_SUFFIX = ("; 0.0;\n", "; 0.5;\n", "; 1.0;\n")
+
+# Decompression chunk size and queue depth for compressed input
+DECOMPRESS_CHUNK = 1 << 20
+DECOMPRESS_QUEUE_CHUNKS = 16
+
+
+class _QueueReader(io.RawIOBase):
+    """Raw byte stream fed by a background thread through a queue."""
+
+    def __init__(self, chunk_queue: "queue.Queue"):
+        self._queue = chunk_queue
+        self._buf = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buf and not self._eof:
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buf = chunk
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def open_pgn_input(path: str):
+    """
+    Open a PGN file for reading, decompressing .zst/.gz transparently.
+
+    Decompression runs in a background thread that feeds a bounded queue
+    of 1 MiB chunks, so the decompressor and the parser overlap instead
+    of stalling each other the way a serial `zstdcat | python3` pipe
+    does when the pipe buffer fills.
+    """
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            print("Error: .zst input requires the zstandard package (pip install zstandard)", file=sys.stderr)
+            sys.exit(1)
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_size=DECOMPRESS_CHUNK
+        )
+    elif path.endswith(".gz"):
+        stream = gzip.open(path, "rb")
+    else:
+        return open(path, "r", buffering=1 << 20,
+                    encoding="ascii", errors="replace")
+
+    chunk_queue: "queue.Queue" = queue.Queue(maxsize=DECOMPRESS_QUEUE_CHUNKS)
+
+    def pump():
+        try:
+            while True:
+                chunk = stream.read(DECOMPRESS_CHUNK)
+                if not chunk:
+                    break
+                chunk_queue.put(chunk)
+        finally:
+            stream.close()
+            chunk_queue.put(None)
+
+    threading.Thread(target=pump, daemon=True).start()
+    return io.TextIOWrapper(
+        io.BufferedReader(_QueueReader(chunk_queue), buffer_size=DECOMPRESS_CHUNK),
+        encoding="ascii", errors="replace"
+    )
 
-    return True
+
+def _count_nonpawn_bb(knights: int, bishops: int, rooks: int, queens: int) -> int:
+    """Count non-pawn, non-king pieces of both colors from raw bitboards."""
+    # One OR over the raw bitboards plus a native popcount covers both
+    # colors, instead of building a SquareSet per piece type and color.
+    return (knights | bishops | rooks | queens).bit_count()
+
+
+# With numba installed, compile the bitboard kernel to machine code; it is
+# pure integer work, and LLVM lowers the clear-lowest-bit loop to a single
+# POPCNT. numba is optional - the int.bit_count() fallback above is already
+# native per call, so this only removes the interpreter dispatch around it.
+try:
+    import numba
+    import numpy as np
+
+    # The explicit uint64 signature matters: bitboards with bit 63 set
+    # (pieces on h8) overflow int64 and would otherwise be typed float64.
+    # Likewise the uint64 constant: numba promotes uint64 - int64 to
+    # float64, which has no bitwise ops.
+    @numba.njit(numba.intp(numba.uint64, numba.uint64, numba.uint64, numba.uint64),
+                cache=True)
+    def _count_nonpawn_bb(knights, bishops, rooks, queens):  # noqa: F811
+        x = knights | bishops | rooks | queens
+        one = np.uint64(1)
+        count = 0
+        while x:
+            x &= x - one
+            count += 1
+        return count
+except ImportError:
+    pass
+
+
+def count_nonpawn_pieces(board: chess.Board) -> int:
+    """Count non-pawn, non-king pieces of both colors via one popcount."""
+    return _count_nonpawn_bb(board.knights, board.bishops, board.rooks, board.queens)
+
+
+def is_quiet_position(board: chess.Board, nonpawn_count: int) -> bool:
+    """Check if position is quiet (no checks, enough non-pawn material)."""
+    # Must not be in check, and must have reasonable material (not just
+    # pawns; fewer than 4 pieces is endgame territory). The caller tracks
+    # nonpawn_count incrementally since only captures/promotions change it.
+    return nonpawn_count >= 4 and not board.is_check()
 
 
 def result_to_score(result: str, side_to_move: chess.Color) -> Optional[float]:
@@ -73,21 +187,95 @@ def get_game_elo(game: chess.pgn.Game) -> Tuple[Optional[int], Optional[int]]:
         return None, None
 
 
-def process_game(game: chess.pgn.Game, min_elo: int, positions_per_game: int) -> List[Tuple[str, float]]:
-    """Extract training positions from a single game."""
-    positions = []
+def headers_pass_filter(header_block: str, min_elo: int) -> bool:
+    """Check the result and ELO tags on a raw PGN header block."""
+    if not RESULT_TAG_RE.search(header_block):
+        return False
+
+    elos = ELO_TAG_RE.findall(header_block)
+    if len(elos) != 2:
+        return False
+
+    return int(elos[0]) >= min_elo and int(elos[1]) >= min_elo
+
+
+def read_filtered_game(pgn_file, min_elo: int) -> Tuple[Optional[chess.pgn.Game], int]:
+    """
+    Read the next game that passes the header filter.
+
+    Scans raw header lines and regex-checks the Result/ELO tags before
+    any PGN parsing; the movetext of rejected games (the majority on raw
+    Lichess dumps) is consumed line-by-line without ever being
+    tokenized. Accepted games are parsed from the buffered text with
+    chess.pgn.read_game. Needs no seeking, so stdin works too.
+
+    Returns (game, games_scanned); game is None at EOF.
+    """
+    games_scanned = 0
+
+    while True:
+        # Skip blank lines between games
+        line = pgn_file.readline()
+        while line and not line.strip():
+            line = pgn_file.readline()
+        if not line:
+            return None, games_scanned
+
+        # Header block runs until the first blank line
+        header_lines = []
+        while line and line.strip():
+            header_lines.append(line)
+            line = pgn_file.readline()
+
+        games_scanned += 1
+        header_block = "".join(header_lines)
+        accept = headers_pass_filter(header_block, min_elo)
+
+        # Movetext runs until the next blank line; only buffer it for
+        # games that passed the header filter
+        movetext_lines = []
+        line = pgn_file.readline()
+        while line and line.strip():
+            if accept:
+                movetext_lines.append(line)
+            line = pgn_file.readline()
+
+        if accept:
+            game_text = header_block + "\n" + "".join(movetext_lines)
+            game = chess.pgn.read_game(io.StringIO(game_text))
+            if game is not None:
+                return game, games_scanned
+
+
+def process_game(game: chess.pgn.Game, min_elo: int, positions_per_game: int) -> Tuple[List[str], array.array]:
+    """
+    Extract training positions from a single game.
+
+    Returns parallel arrays (fens, scores); the scores live in an
+    array('f') (4 bytes each) rather than tuples of Python floats, which
+    keeps large collection runs compact and GC-light.
+    """
+    fens: List[str] = []
+    scores = array.array("f")
 
     # Check result
     result = game.headers.get("Result", "*")
     if result not in ["1-0", "0-1"]:  # Only use decisive games
-        return positions
+        return fens, scores
 
     # Check ELO
     white_elo, black_elo = get_game_elo(game)
     if white_elo is None or black_elo is None:
-        return positions
+        return fens, scores
     if white_elo < min_elo or black_elo < min_elo:
-        return positions
+        return fens, scores
+
+    # The score only depends on the result and the side to move, so
+    # resolve both perspectives once per game instead of per position.
+    white_score = result_to_score(result, chess.WHITE)
+    black_score = result_to_score(result, chess.BLACK)
+    if white_score is None:
+        return fens, scores
 
     # Process moves
     board = game.board()
@@ -96,9 +284,30 @@ def process_game(game: chess.pgn.Game, min_elo: int, positions_per_game: int) ->
 
     collected_count = 0
 
+    # Non-pawn material only changes on captures and promotions (~5% of
+    # moves), so popcount the bitboards once at game start and maintain
+    # the count across moves instead of rescanning per position.
+    nonpawn_count = count_nonpawn_pieces(board)
+
+    # Pre-bind the hot board methods once per game; skipping the repeated
+    # LOAD_ATTR also helps the pypy3 JIT specialize this loop.
+    push = board.push
+    is_capture = board.is_capture
+    piece_type_at = board.piece_type_at
+
     while node.variations and collected_count < positions_per_game:
         node = node.variations[0]
-        board.push(node.move)
+        move = node.move
+
+        if is_capture(move):
+            # piece_type_at(to_square) is None for en passant: a pawn
+            captured = piece_type_at(move.to_square)
+            if captured is not None and captured != chess.PAWN:
+                nonpawn_count -= 1
+        if move.promotion:
+            nonpawn_count += 1
+
+        push(move)
         move_num += 1
 
         # Only collect from moves 10-50
@@ -108,20 +317,72 @@ def process_game(game: chess.pgn.Game, min_elo: int, positions_per_game: int) ->
             break
 
         # Check if position is quiet
-        if not is_quiet_position(board):
+        if not is_quiet_position(board, nonpawn_count):
             continue
 
-        # Convert result to score
-        score = result_to_score(result, board.turn)
-        if score is None:
-            continue
-
-        # Save position
-        fen = board.fen()
-        positions.append((fen, score))
+        # Save position; board.epd() skips the halfmove/fullmove clock
+        # formatting that board.fen() pays for, and the training output
+        # is EPD anyway.
+        fens.append(board.epd())
+        scores.append(white_score if board.turn == chess.WHITE else black_score)
         collected_count += 1
 
-    return positions
+    return fens, scores
+
+
+def find_game_chunks(pgn_path: str, chunk_games: int = 1000) -> List[Tuple[int, int]]:
+    """
+    Split a PGN file into byte ranges of whole games.
+
+    Scans for game boundaries (a line starting with '[Event ' following a
+    blank line) and groups them into chunks of chunk_games games. Returns
+    a list of (start, end) byte offsets covering the whole file.
+    """
+    starts = []
+    with open(pgn_path, "rb") as f:
+        at_blank = True
+        pos = 0
+        for line in f:
+            if at_blank and line.startswith(b"[Event "):
+                starts.append(pos)
+            at_blank = not line.strip()
+            pos += len(line)
+        file_size = pos
+
+    chunks = []
+    for i in range(0, len(starts), chunk_games):
+        end = starts[i + chunk_games] if i + chunk_games < len(starts) else file_size
+        chunks.append((starts[i], end))
+    return chunks
+
+
+def _collect_chunk(chunk_args) -> Tuple[List[str], array.array, int, int]:
+    """Worker: collect positions from one byte range of the PGN file."""
+    pgn_path, start, end, min_elo, positions_per_game = chunk_args
+
+    with open(pgn_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    pgn_file = io.StringIO(data.decode("ascii", errors="replace"))
+    fens: List[str] = []
+    scores = array.array("f")
+    games_scanned = 0
+    games_used = 0
+
+    while True:
+        game, scanned = read_filtered_game(pgn_file, min_elo)
+        games_scanned += scanned
+        if game is None:
+            break
+
+        game_fens, game_scores = process_game(game, min_elo, positions_per_game)
+        if game_fens:
+            games_used += 1
+            fens.extend(game_fens)
+            scores.extend(game_scores)
+
+    return fens, scores, games_scanned, games_used
 
 
 def main():
@@ -139,8 +400,13 @@ Examples:
   # Process from stdin
   cat games.pgn | python3 collect_lichess_data.py > training.epd
 
-  # Process compressed file
-  zstdcat games.pgn.zst | python3 collect_lichess_data.py --max-positions 20000 > training.epd
+  # Process compressed file directly (.zst needs pip install zstandard);
+  # decompression overlaps parsing in a background thread
+  python3 collect_lichess_data.py --max-positions 20000 games.pgn.zst > training.epd
+
+  # PGN parsing is pure-Python and JIT-friendly; running under pypy3
+  # is typically 3-5x faster than CPython
+  pypy3 collect_lichess_data.py games.pgn > training.epd
         """
     )
 
@@ -167,6 +433,12 @@ Examples:
         default=5,
         help="Maximum positions per game (default: 5)"
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes (requires a file argument, default: 1)"
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -175,15 +447,12 @@ Examples:
 
     args = parser.parse_args()
 
-    # Open input
-    if args.input_file:
-        try:
-            pgn_file = open(args.input_file, "r")
-        except IOError as e:
-            print(f"Error opening file: {e}", file=sys.stderr)
-            sys.exit(1)
-    else:
-        pgn_file = sys.stdin
+    if args.jobs > 1 and not args.input_file:
+        print("Error: --jobs requires an input file (stdin cannot be sharded)", file=sys.stderr)
+        sys.exit(1)
+    if args.jobs > 1 and args.input_file.endswith((".zst", ".gz")):
+        print("Error: --jobs requires an uncompressed file (compressed input cannot be sharded)", file=sys.stderr)
+        sys.exit(1)
 
     # Process games
     total_positions = 0
@@ -195,25 +464,85 @@ Examples:
         print(f"Only using decisive games with positions from moves 10-50", file=sys.stderr)
         print("", file=sys.stderr)
 
+    if args.jobs > 1:
+        # Shard the file into whole-game byte ranges and farm them out;
+        # games are independent, so the workers just run the sequential
+        # per-game loop over their slice. imap keeps output deterministic.
+        chunks = find_game_chunks(args.input_file)
+        tasks = [
+            (args.input_file, start, end, args.min_elo, args.positions_per_game)
+            for start, end in chunks
+        ]
+
+        out_buffer = []
+        with multiprocessing.Pool(args.jobs) as pool:
+            for fens, scores, games_scanned, games_used in pool.imap(_collect_chunk, tasks):
+                total_games += games_scanned
+                processed_games += games_used
+
+                for fen, score in zip(fens, scores):
+                    if total_positions >= args.max_positions:
+                        break
+                    out_buffer.append(fen + SCORE_SUFFIX[int(score * 2)])
+                    total_positions += 1
+
+                if len(out_buffer) >= OUTPUT_FLUSH_LINES:
+                    sys.stdout.write(''.join(out_buffer))
+                    out_buffer.clear()
+
+                if args.verbose:
+                    print(f"Processed {total_games} games, collected {total_positions} positions ({processed_games} games used)", file=sys.stderr)
+
+                if total_positions >= args.max_positions:
+                    break
+
+        sys.stdout.write(''.join(out_buffer))
+        print_final_stats(args, total_games, processed_games, total_positions)
+        return
+
+    # Open input with a 1 MiB buffer (~128x fewer read() syscalls than the
+    # 8 KiB default) and the ASCII decoder, which is considerably faster
+    # than UTF-8 on pure PGN; non-ASCII only ever shows up in player names.
+    # .pgn.zst and .pgn.gz decompress in a background thread.
+    if args.input_file:
+        try:
+            pgn_file = open_pgn_input(args.input_file)
+        except IOError as e:
+            print(f"Error opening file: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        pgn_file = io.TextIOWrapper(
+            io.BufferedReader(sys.stdin.buffer, buffer_size=1 << 20),
+            encoding="ascii", errors="replace"
+        )
+
+    # Batch output lines and emit them with one write per batch; a print()
+    # per accepted position means a syscall per line, which dominates once
+    # parsing is fast.
+    out_buffer = []
+
     try:
         while total_positions < args.max_positions:
-            game = chess.pgn.read_game(pgn_file)
+            game, games_scanned = read_filtered_game(pgn_file, args.min_elo)
+            total_games += games_scanned
             if game is None:
                 break
 
-            total_games += 1
-
             # Process game
-            positions = process_game(game, args.min_elo, args.positions_per_game)
+            fens, scores = process_game(game, args.min_elo, args.positions_per_game)
 
-            if positions:
+            if fens:
                 processed_games += 1
-                for fen, score in positions:
+                for fen, score in zip(fens, scores):
                     if total_positions >= args.max_positions:
                         break
-                    print(f"{fen}; {score};")
+                    out_buffer.append(fen + SCORE_SUFFIX[int(score * 2)])
                     total_positions += 1
 
+                if len(out_buffer) >= OUTPUT_FLUSH_LINES:
+                    sys.stdout.write(''.join(out_buffer))
+                    out_buffer.clear()
+
             # Progress update
             if args.verbose and total_games % 100 == 0:
                 print(f"Processed {total_games} games, collected {total_positions} positions ({processed_games} games used)", file=sys.stderr)
@@ -223,9 +552,15 @@ Examples:
             print("\nInterrupted by user", file=sys.stderr)
 
     finally:
+        sys.stdout.write(''.join(out_buffer))
         if args.input_file:
             pgn_file.close()
 
+    print_final_stats(args, total_games, processed_games, total_positions)
+
+
+def print_final_stats(args, total_games: int, processed_games: int, total_positions: int) -> None:
+    """Print final collection statistics to stderr (verbose mode only)."""
     if args.verbose:
         print("", file=sys.stderr)
         print(f"Final statistics:", file=sys.stderr)
@@ -1,40 +1,100 @@
 #!/usr/bin/env python3
-"""Simple WebSocket test client for chess engine server"""
+"""WebSocket test client / stress harness for chess engine server
+
+Usage:
+    python3 test-ws-client.py                  # single request smoke test
+    python3 test-ws-client.py 8 100           # 8 connections x 100 requests
+"""
 
 import asyncio
-import websockets
 import json
+import sys
+import time
+
+import websockets
 
-async def test_engine():
-    uri = "ws://127.0.0.1:8080"
-    print(f"Connecting to {uri}...")
+# orjson encodes ~5x faster than stdlib json, which matters once thousands
+# of requests per second go through the encode path; fall back silently for
+# the single-request smoke test case.
+try:
+    import orjson
 
-    async with websockets.connect(uri) as websocket:
-        print("✅ Connected to WebSocket server")
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
 
-        # Send analyze request
-        request = {
-            "type": "analyze",
-            "id": "test-1",
-            "fen": "startpos",
-            "limit": {"kind": "depth", "depth": 5}
-        }
+    loads = orjson.loads
+except ImportError:
+    dumps = json.dumps
+    loads = json.loads
 
-        print(f"📤 Sending: {json.dumps(request, indent=2)}")
-        await websocket.send(json.dumps(request))
+URI = "ws://127.0.0.1:8080"
 
-        # Receive messages
-        while True:
-            try:
-                message = await websocket.recv()
-                msg = json.loads(message)
-                print(f"📥 Received: {msg['type']} - {json.dumps(msg['payload'], indent=2)}")
+# Requests kept in flight per connection; pipelining amortizes the RTT
+# instead of paying it per request.
+PIPELINE = 8
 
-                if msg['type'] == 'bestMove':
-                    print(f"✅ Test successful! Best move: {msg['payload']['best']}")
-                    break
+
+async def one_session(client_id: int, n_reqs: int, verbose: bool) -> int:
+    """Run n_reqs analyze requests over one connection, pipelined."""
+    completed = 0
+
+    async with websockets.connect(URI) as websocket:
+        if verbose:
+            print("✅ Connected to WebSocket server")
+
+        next_req = 0
+        in_flight = 0
+
+        while completed < n_reqs:
+            # Top up the pipeline, then drain bestMove responses
+            while next_req < n_reqs and in_flight < PIPELINE:
+                request = {
+                    "type": "analyze",
+                    "id": f"client{client_id}-req{next_req}",
+                    "fen": "startpos",
+                    "limit": {"kind": "depth", "depth": 5}
+                }
+                if verbose:
+                    print(f"📤 Sending: {dumps(request)}")
+                await websocket.send(dumps(request))
+                next_req += 1
+                in_flight += 1
+
+            try:
+                msg = loads(await websocket.recv())
             except websockets.exceptions.ConnectionClosed:
                 break
 
+            if verbose:
+                print(f"📥 Received: {msg['type']} - {dumps(msg['payload'])}")
+
+            if msg['type'] == 'bestMove':
+                if verbose:
+                    print(f"✅ Test successful! Best move: {msg['payload']['best']}")
+                completed += 1
+                in_flight -= 1
+
+    return completed
+
+
+async def test_engine(n_clients: int = 1, n_reqs: int = 1):
+    print(f"Connecting to {URI} ({n_clients} connection(s) x {n_reqs} request(s))...")
+
+    # Keep the chatty per-message output for the single-request smoke test
+    verbose = n_clients == 1 and n_reqs == 1
+
+    start = time.perf_counter()
+    totals = await asyncio.gather(
+        *(one_session(i, n_reqs, verbose) for i in range(n_clients))
+    )
+    elapsed = time.perf_counter() - start
+
+    total = sum(totals)
+    print(f"Completed {total}/{n_clients * n_reqs} requests "
+          f"in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.1f} req/s)")
+
+
 if __name__ == "__main__":
-    asyncio.run(test_engine())
+    n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    n_reqs = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    asyncio.run(test_engine(n_clients, n_reqs))